@@ -1,13 +1,23 @@
 
 import logging
+import voluptuous as vol
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.helpers.storage import Store
+from .capabilities import async_probe_capabilities, apply_capabilities, is_current
 from .hoymiles_dtu_client import HoymilesDtuClient  # Import the client class
+from .profiling import PollProfiler
 
 
 DOMAIN = "hoymiles_modbus_tcp"
 _LOGGER = logging.getLogger(__name__)
 
+CAPABILITIES_STORAGE_VERSION = 1
+
+PROFILE_SCHEMA = vol.Schema({
+    vol.Optional("cycles", default=5): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+})
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     hass.data.setdefault(DOMAIN, {})
 
@@ -16,20 +26,61 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     client = HoymilesDtuClient(
         host=entry.data["dtu_ip"],
         port=entry.data["dtu_port"],
+        max_ports=entry.data.get("max_ports"),
     )
     _LOGGER.debug("Connection to Hoymiles DTU established successfully.")
+
+    await async_load_capabilities(hass, client)
     
     hass.data[DOMAIN][entry.entry_id] = client
+
+    if not hass.services.has_service(DOMAIN, "profile"):
+        async def async_profile(call: ServiceCall) -> None:
+            """Profile the next poll cycles of every configured DTU."""
+            for entry_id, dtu_client in hass.data[DOMAIN].items():
+                if dtu_client.profiler:
+                    dtu_client.profiler.close()
+                dtu_client.profiler = PollProfiler(
+                    hass.config.path(), f"{DOMAIN}_{entry_id}", call.data["cycles"]
+                )
+                _LOGGER.info(f"Profiling the next {call.data['cycles']} poll cycles of {dtu_client.host}")
+
+        hass.services.async_register(DOMAIN, "profile", async_profile, schema=PROFILE_SCHEMA)
     _LOGGER.debug("Hoymiles Modbus TCP config entry setup complete: %s", entry.data)  
-    await hass.config_entries.async_forward_entry_setups(entry, ["sensor", "number"])
+    await hass.config_entries.async_forward_entry_setups(entry, ["sensor", "number", "binary_sensor"])
 
     
     return True
 
+async def async_load_capabilities(hass: HomeAssistant, client: HoymilesDtuClient) -> None:
+    """Apply the cached capability profile of the DTU, probing it on first sight."""
+    try:
+        await client.map_microinverters()
+        serial = await client.read_serial_number()
+        store = Store(hass, CAPABILITIES_STORAGE_VERSION, f"{DOMAIN}.capabilities")
+        profiles = await store.async_load() or {}
+        profile = profiles.get(serial)
+        if not is_current(profile, len(client.get_panels())):
+            # A failed probe raises, so nothing is cached and it runs again next setup
+            profile = await async_probe_capabilities(client, serial)
+            profiles[serial] = profile
+            await store.async_save(profiles)
+        apply_capabilities(client, profile)
+    except Exception as e:
+        # Without a profile the conservative per-port defaults stay in place
+        _LOGGER.warning(f"Could not determine DTU capabilities: {e}")
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     await hass.config_entries.async_forward_entry_unload(entry, "sensor")
     await hass.config_entries.async_forward_entry_unload(entry, "number")
+    await hass.config_entries.async_forward_entry_unload(entry, "binary_sensor")
     # Clean up the client instance
-    hass.data[DOMAIN].pop(entry.entry_id)
+    client = hass.data[DOMAIN].pop(entry.entry_id)
+    if client.profiler:
+        client.profiler.close()
+        client.profiler = None
+    if not hass.data[DOMAIN]:
+        hass.services.async_remove(DOMAIN, "profile")
     return True
 
@@ -0,0 +1,130 @@
+import logging
+import warnings
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+# Cycles kept in the rolling window
+DEFAULT_WINDOW = 30
+# Cycles where the fleet median is below this (W) are skipped, e.g. at night
+MIN_FLEET_POWER = 10
+# Robust z-score below which a panel counts as underperforming
+OUTLIER_THRESHOLD = -3.0
+# Scale factor turning the median absolute deviation into a standard deviation
+MAD_SCALE = 1.4826
+# Lower bound of the deviation scale, so an identical fleet does not hide a lone outlier
+MIN_SCALE = 0.05
+
+
+class PanelPerformanceAnalyzer:
+    """Score every port's yield against its inverter siblings and the fleet.
+
+    Fed with each poll snapshot, all ports are handled as one array per cycle:
+    the power of every port is normalized by the fleet median and by the mean of
+    its siblings on the same microinverter, the fleet ratio is averaged over a
+    rolling window, and a robust z-score (median/MAD) of that average flags
+    panels that persistently yield less than the rest. The sibling ratio is
+    scored on the same scale and the lower of both scores counts, so a panel
+    lagging its own microinverter is flagged even when the fleet varies a lot.
+    This assumes panels of comparable size and orientation.
+
+    Listeners are notified when the set of outliers changes, and otherwise at
+    most once per window when the rounded results change.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, min_fleet_power=MIN_FLEET_POWER, threshold=OUTLIER_THRESHOLD):
+        self.window = window
+        self.min_fleet_power = min_fleet_power
+        self.threshold = threshold
+
+        self.addresses = []
+        self.results = {}
+        self.outliers = []
+        self._listeners = []
+        self._groups = None
+        self._fleet_ratio = None
+        self._sibling_ratio = None
+        self._cursor = 0
+        self._notified_cursor = None
+
+    def add_listener(self, listener):
+        """Register a callable invoked when the results change."""
+        self._listeners.append(listener)
+
+        def remove():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove
+
+    def _reset(self, addresses, serials):
+        self.addresses = addresses
+        _, self._groups = np.unique(serials, return_inverse=True)
+        self._fleet_ratio = np.full((self.window, len(addresses)), np.nan)
+        self._sibling_ratio = np.full((self.window, len(addresses)), np.nan)
+        self._cursor = 0
+        self._notified_cursor = None
+
+    def process(self, snapshot):
+        addresses = sorted(snapshot)
+        if not addresses:
+            return
+        if addresses != self.addresses:
+            self._reset(addresses, [str(snapshot[a].get('serial_number')) for a in addresses])
+
+        power = np.array([
+            np.nan if snapshot[a].get('stale') else snapshot[a].get('pv_power') for a in addresses
+        ], dtype=float)
+
+        fleet_median = np.nanmedian(power) if not np.all(np.isnan(power)) else np.nan
+        if not fleet_median >= self.min_fleet_power:
+            return
+
+        # Mean power of the other ports on the same microinverter
+        valid = ~np.isnan(power)
+        group_sum = np.bincount(self._groups, weights=np.where(valid, power, 0))
+        group_count = np.bincount(self._groups, weights=valid.astype(float))
+        sibling_count = group_count[self._groups] - valid
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sibling_mean = (group_sum[self._groups] - np.where(valid, power, 0)) / sibling_count
+            sibling_ratio = np.where(sibling_mean > 0, power / sibling_mean, np.nan)
+
+        row = self._cursor % self.window
+        self._fleet_ratio[row] = power / fleet_median
+        self._sibling_ratio[row] = sibling_ratio
+        self._cursor += 1
+
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            # nanmean/nanmedian warn about ports without any sample yet
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            relative_yield = np.nanmean(self._fleet_ratio, axis=0)
+            sibling_yield = np.nanmean(self._sibling_ratio, axis=0)
+            center = np.nanmedian(relative_yield)
+            mad = np.nanmedian(np.abs(relative_yield - center)) * MAD_SCALE
+            scale = max(mad, MIN_SCALE * center) if center > 0 else MIN_SCALE
+            # Siblings are expected to yield the same, so their ratio is centered on 1
+            score = np.fmin((relative_yield - center) / scale, (sibling_yield - 1) / scale)
+
+        results = {
+            address: {
+                'relative_yield': _round(relative_yield[i], 2),
+                'sibling_ratio': _round(sibling_yield[i], 2),
+                'score': _round(score[i], 1),
+            }
+            for i, address in enumerate(addresses)
+        }
+        outliers = [addresses[i] for i in np.flatnonzero(score < self.threshold)]
+
+        throttled = self._notified_cursor is not None and self._cursor - self._notified_cursor < self.window
+        if outliers == self.outliers and (results == self.results or throttled):
+            return
+        self.results = results
+        self.outliers = outliers
+        self._notified_cursor = self._cursor
+        for listener in list(self._listeners):
+            listener()
+
+
+def _round(value, digits):
+    return None if np.isnan(value) else round(float(value), digits)
+
@@ -0,0 +1,76 @@
+import logging
+from homeassistant.components.binary_sensor import BinarySensorEntity, BinarySensorDeviceClass
+
+from .ha_hoymiles_dtu import HAHoymilesDTU
+from .status_events import StatusEventEngine
+
+_LOGGER = logging.getLogger(__name__)
+DOMAIN = "hoymiles_modbus_tcp"
+
+
+async def async_setup_entry(hass, config_entry, async_add_entities):
+    client = hass.data[DOMAIN][config_entry.entry_id]
+    dtu = HAHoymilesDTU(hass, DOMAIN, client)
+
+    await dtu.map_microinverters()
+    await dtu.fetch_serial_number()
+
+    device_info = dtu.device_info
+    sid = dtu.sid
+    name = dtu.name
+
+    # Status is decoded from the snapshot the other sensors already poll,
+    # so these entities never talk to the DTU themselves.
+    engine = StatusEventEngine(hass, sid)
+    config_entry.async_on_unload(client.add_snapshot_listener(engine.process))
+
+    entities = [
+        HoymilesStationAlarmSensor(engine, name, sid, device_info),
+        HoymilesStationLinkSensor(engine, name, sid, device_info),
+    ]
+    async_add_entities(entities)
+
+
+class HoymilesStatusBinarySensor(BinarySensorEntity):
+    """Problem sensor that is only written when the status engine reports a transition."""
+    def __init__(self, engine, name, sid, device_info):
+        self._engine = engine
+        self._sid = sid
+        self._attr_device_class = BinarySensorDeviceClass.PROBLEM
+        self._attr_device_info = device_info
+        self._attr_should_poll = False
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._engine.add_listener(self.async_write_ha_state))
+
+
+class HoymilesStationAlarmSensor(HoymilesStatusBinarySensor):
+    def __init__(self, engine, name, sid, device_info):
+        super().__init__(engine, name, sid, device_info)
+        self._attr_name = f"{name} Alarm"
+        self._attr_unique_id = f"{sid}_alarm"
+        self._attr_icon = "mdi:alert-circle"
+
+    @property
+    def is_on(self):
+        return bool(self._engine.active_alarms)
+
+    @property
+    def extra_state_attributes(self):
+        return {"alarms": dict(self._engine.active_alarms)}
+
+
+class HoymilesStationLinkSensor(HoymilesStatusBinarySensor):
+    def __init__(self, engine, name, sid, device_info):
+        super().__init__(engine, name, sid, device_info)
+        self._attr_name = f"{name} Link Problem"
+        self._attr_unique_id = f"{sid}_link_problem"
+        self._attr_icon = "mdi:lan-disconnect"
+
+    @property
+    def is_on(self):
+        return bool(self._engine.lost_links)
+
+    @property
+    def extra_state_attributes(self):
+        return {"lost_links": dict(self._engine.lost_links)}
@@ -0,0 +1,138 @@
+import logging
+import time
+
+from .hoymiles_dtu_client import DtuResponseError, PORT_BASE_ADDRESS, PORT_BLOCK_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+# Bumped when the probe changes, so cached profiles are probed again
+PROFILE_VERSION = 3
+# Profiles older than this (seconds) are probed again, e.g. after firmware updates
+PROFILE_MAX_AGE = 30 * 24 * 3600
+# Largest register count a Modbus read request can carry
+MODBUS_MAX_COUNT = 125
+# Request delays tried from slow to fast when probing the request rate
+REQUEST_DELAYS = (0.2, 0.1, 0.05, 0.02, 0.0)
+BURST_SIZE = 5
+# A delay is sustainable while latency stays within this factor of the slowest delay
+LATENCY_FACTOR = 2.0
+
+
+async def _accepts(client, address, count):
+    """Return whether the DTU answers the read.
+
+    Only a Modbus exception response counts as a rejection. Connection errors and
+    timeouts propagate, so a network blip aborts the probe instead of being
+    recorded as a limit of the device.
+    """
+    try:
+        await client.read_registers(address, count)
+        return True
+    except DtuResponseError as e:
+        _LOGGER.debug(f"DTU rejected read of {count} registers at {hex(address)}: {e}")
+        return False
+
+
+async def _probe_span(client, address, high):
+    """Binary search the largest span up to high readable from address onwards."""
+    low = 1
+    if not await _accepts(client, address, low):
+        return low
+    while low < high:
+        middle = (low + high + 1) // 2
+        if await _accepts(client, address, middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+async def _probe_max_count(client):
+    """Find the largest span readable both from a port start and across a port boundary.
+
+    Read plans start at any field address and may run into the next port, so the
+    span found at the first port is checked again starting mid-block, straddling
+    the boundary to the second port.
+    """
+    aligned = await _probe_span(client, PORT_BASE_ADDRESS, MODBUS_MAX_COUNT)
+    straddling = PORT_BASE_ADDRESS + PORT_BLOCK_SIZE - aligned // 2
+    if await _accepts(client, straddling, aligned):
+        return aligned
+    return await _probe_span(client, straddling, aligned - 1)
+
+
+async def _probe_invalid_fields(client, panel):
+    """Return the lookup fields of the first port the DTU refuses to read."""
+    invalid = []
+    for name in panel.lookup:
+        address, count = panel.field_address(name)
+        if not await _accepts(client, address, count):
+            invalid.append(name)
+    return invalid
+
+
+async def _probe_request_delay(client):
+    """Find the shortest pause between requests the DTU sustains without errors or slowdown."""
+    baseline = None
+    best = client.request_delay
+    for delay in REQUEST_DELAYS:
+        client.request_delay = delay
+        started = time.perf_counter()
+        for _ in range(BURST_SIZE):
+            if not await _accepts(client, PORT_BASE_ADDRESS, 1):
+                return best
+        latency = (time.perf_counter() - started) / BURST_SIZE - delay
+        if baseline is None:
+            baseline = latency
+        elif latency > baseline * LATENCY_FACTOR:
+            return best
+        best = delay
+    return best
+
+
+async def async_probe_capabilities(client, serial):
+    """Probe the read limits of a DTU, returning a profile to cache and apply."""
+    panels = client.get_panels()
+    original_delay = client.request_delay
+    try:
+        max_count = await _probe_max_count(client)
+        invalid_fields = await _probe_invalid_fields(client, panels[0]) if panels else []
+        if panels and len(invalid_fields) == len(panels[0].lookup):
+            raise Exception("DTU refused every port field, not caching the profile")
+        request_delay = await _probe_request_delay(client)
+    finally:
+        client.request_delay = original_delay
+
+    profile = {
+        'version': PROFILE_VERSION,
+        'serial': serial,
+        'probed_at': time.time(),
+        'port_count': len(panels),
+        'max_count': max_count,
+        'request_delay': request_delay,
+        'invalid_fields': invalid_fields,
+    }
+    _LOGGER.info(f"Probed DTU {serial}: {profile}")
+    return profile
+
+
+def is_current(profile, port_count):
+    """Return whether a cached profile can be used without probing again.
+
+    A profile probed with a different number of ports is probed again, since the
+    DTU may not answer reads into port blocks that were empty at the time.
+    """
+    return (
+        profile is not None
+        and profile.get('version') == PROFILE_VERSION
+        and profile.get('port_count') == port_count
+        and time.time() - profile.get('probed_at', 0) < PROFILE_MAX_AGE
+    )
+
+
+def apply_capabilities(client, profile):
+    """Let the client's read plans use the largest batch the DTU accepts."""
+    client.scheduler.max_count = profile['max_count']
+    client.scheduler.max_gap = profile['max_count']
+    client.scheduler.disabled_fields = set(profile['invalid_fields'])
+    client.request_delay = profile['request_delay']
@@ -0,0 +1,195 @@
+"""Raw register capture and deterministic replay for the Hoymiles DTU client.
+
+A capture file starts with a magic header followed by fixed-size record headers,
+each followed by the raw registers of the response:
+
+    <d  timestamp   (epoch seconds)
+    <f  latency     (seconds spent in read_holding_registers)
+    <H  address
+    <H  count       (registers requested)
+    <B  status      (STATUS_OK, STATUS_ERROR_RESPONSE, STATUS_EXCEPTION)
+    <H  n           (registers returned)
+    <nH registers
+
+Replay a capture offline by handing a ReplayTransport to the client. The client
+then plans its reads with the captured timestamps instead of the wall clock, so
+the field scheduler requests the same ranges as during the capture, whatever the
+replay speed:
+
+    client = HoymilesDtuClient("replay", 502, transport=ReplayTransport("dtu.cap", speed=0))
+    client.request_delay = 0
+    await client.map_microinverters()
+    await client.poll()
+"""
+import asyncio
+import logging
+import os
+import struct
+import threading
+from collections import defaultdict, deque, namedtuple
+
+_LOGGER = logging.getLogger(__name__)
+
+MAGIC = b"HMCAP1\n"
+RECORD_HEADER = struct.Struct("<dfHHBH")
+
+STATUS_OK = 0
+STATUS_ERROR_RESPONSE = 1
+STATUS_EXCEPTION = 2
+
+CaptureRecord = namedtuple("CaptureRecord", "timestamp latency address count status registers")
+
+
+def encode_record(timestamp, latency, address, count, status, registers=()):
+    """Pack a single request/response pair."""
+    header = RECORD_HEADER.pack(timestamp, latency, address, count, status, len(registers))
+    return header + struct.pack(f"<{len(registers)}H", *registers)
+
+
+def read_capture(path):
+    """Yield the CaptureRecords stored in a capture file."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Hoymiles register capture")
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # A truncated trailing record is what a crash mid-write leaves behind
+                return
+            timestamp, latency, address, count, status, n = RECORD_HEADER.unpack(header)
+            payload = f.read(n * 2)
+            if len(payload) < n * 2:
+                return
+            registers = list(struct.unpack(f"<{n}H", payload))
+            yield CaptureRecord(timestamp, latency, address, count, status, registers)
+
+
+class CaptureWriter:
+    """Append-only capture file with size based rotation.
+
+    Records are buffered in memory by append(). async_flush() takes the buffer on
+    the event loop and only hands the bytes to an executor for the blocking write;
+    flush() does the same synchronously, for use outside of an event loop.
+    """
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backup_count=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, latency, address, count, status, registers=()):
+        self._buffer.append(encode_record(timestamp, latency, address, count, status, registers))
+
+    def _take(self):
+        data = b"".join(self._buffer)
+        self._buffer = []
+        return data
+
+    def flush(self):
+        self._write(self._take())
+
+    async def async_flush(self):
+        data = self._take()
+        if data:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+
+    def _write(self, data):
+        if not data:
+            return
+        # Flushes of consecutive polls may overlap in the executor
+        with self._lock:
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            if size and size + len(data) > self.max_bytes:
+                self._rotate()
+                size = 0
+
+            with open(self.path, "ab") as f:
+                if size == 0:
+                    f.write(MAGIC)
+                f.write(data)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        _LOGGER.debug(f"Rotated register capture {self.path}")
+
+
+class ReplayResponse:
+    """Minimal stand-in for a pymodbus read response."""
+
+    def __init__(self, registers, status):
+        self.registers = registers
+        self._status = status
+
+    def isError(self):
+        return self._status != STATUS_OK
+
+    def __str__(self):
+        return f"ReplayResponse(status={self._status}, registers={len(self.registers)})"
+
+
+class ReplayTransport:
+    """Feed a capture back to HoymilesDtuClient in place of AsyncModbusTcpClient.
+
+    Responses are matched on (address, count) and served in the order they were
+    captured. clock() returns the timestamp of the record following the latest one
+    served, i.e. when the next poll started, which the client plans its polls with, so a replay is deterministic. speed
+    scales the captured latencies: 1.0 replays in real time, 10.0 ten times faster
+    and 0 without any delay. With loop set, the capture starts over (with its
+    timestamps shifted past the end) once a request finds no response left.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.speed = speed
+        self.loop = loop
+        self.connected = False
+        self._timeline = list(read_capture(path))
+        self._offset = 0.0
+        self._restart()
+
+    def _restart(self):
+        self._records = defaultdict(deque)
+        for index, record in enumerate(self._timeline):
+            self._records[(record.address, record.count)].append(index)
+        self._latest = -1
+
+    def clock(self):
+        if not self._timeline:
+            return self._offset
+        position = min(self._latest + 1, len(self._timeline) - 1)
+        return self._timeline[position].timestamp + self._offset
+
+    async def connect(self):
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+    async def read_holding_registers(self, address, count=1, **kwargs):
+        key = (address, count)
+        if not self._records[key] and self.loop and self._latest >= 0:
+            first, last = self._timeline[0].timestamp, self._timeline[-1].timestamp
+            # Leave a gap of one average request between the last and first record
+            self._offset += (last - first) * (1 + 1 / len(self._timeline)) or 1.0
+            self._restart()
+        queue = self._records[key]
+        if not queue:
+            raise ConnectionError(f"No captured response left for {hex(address)} ({count})")
+
+        index = queue.popleft()
+        self._latest = max(self._latest, index)
+        record = self._timeline[index]
+        if self.speed:
+            await asyncio.sleep(record.latency / self.speed)
+        if record.status == STATUS_EXCEPTION:
+            raise ConnectionError(f"Captured exception for {hex(address)} ({count})")
+        return ReplayResponse(record.registers, record.status)
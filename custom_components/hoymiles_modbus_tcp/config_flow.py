@@ -1,9 +1,11 @@
 import logging
 import voluptuous as vol
 from homeassistant import config_entries
+from homeassistant.components import network
 from homeassistant.core import callback
 
-from .hoymiles_dtu_client import HoymilesDtuClient
+from .discovery import MIN_SCAN_PREFIX, async_discover_dtus, scan_network
+from .hoymiles_dtu_client import HoymilesDtuClient, DTU_MAX_PORTS
 
 DOMAIN = "hoymiles_modbus_tcp"
 
@@ -14,21 +16,44 @@ DATA_SCHEMA = vol.Schema({
     vol.Required("dtu_port", default="502"): str,
 })
 
+MANUAL_ENTRY = "manual"
+
 class HoymilesConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     VERSION = 1
 
+    def __init__(self):
+        self._discovered = {}
+
     async def _test_connection(self, dtu_ip: str, dtu_port: str) -> bool:
         """Test connection to DTU and return True if successful."""
         try:
             client = HoymilesDtuClient(host=dtu_ip, port=int(dtu_port))
             _LOGGER.debug(f"Testing connection to DTU at {dtu_ip}:{dtu_port}")
-            await self.hass.async_add_executor_job(client.test_connection)
+            result = await client.test_connection()
             await client.disconnect()
-            return True
+            return result
         except Exception as e:
             _LOGGER.error(f"Connection failed: {e}")
             return False
 
+    async def _discover(self) -> dict:
+        """Scan the subnet of the HA host (at most a /24) for DTUs that are not configured yet."""
+        try:
+            source_ip = await network.async_get_source_ip(self.hass)
+            prefix = MIN_SCAN_PREFIX
+            for adapter in await network.async_get_adapters(self.hass):
+                for ipv4 in adapter["ipv4"]:
+                    if ipv4["address"] == source_ip:
+                        prefix = ipv4["network_prefix"]
+            subnet = scan_network(source_ip, prefix)
+            found = await async_discover_dtus(subnet)
+        except Exception as e:
+            _LOGGER.warning(f"DTU discovery failed: {e}")
+            return {}
+
+        configured = {entry.data.get("dtu_ip") for entry in self._async_current_entries()}
+        return {host: serial for host, serial in found.items() if host not in configured}
+
     def _create_data_schema(self, defaults: dict = None) -> vol.Schema:
         """Create data schema with optional default values."""
         defaults = defaults or {}
@@ -40,6 +65,29 @@ class HoymilesConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     async def async_step_user(self, user_input=None):
         errors = {}
 
+        if user_input is None:
+            self._discovered = await self._discover()
+            if not self._discovered:
+                return await self.async_step_manual()
+        elif user_input["dtu_ip"] == MANUAL_ENTRY:
+            return await self.async_step_manual()
+        else:
+            data = {"dtu_ip": user_input["dtu_ip"], "dtu_port": "502"}
+            if await self._test_connection(data["dtu_ip"], data["dtu_port"]):
+                return self.async_create_entry(title="Hoymiles Modbus TCP", data=data)
+            errors["base"] = "cannot_connect"
+
+        choices = {host: f"{host} (DTU {serial})" for host, serial in self._discovered.items()}
+        choices[MANUAL_ENTRY] = "Enter address manually"
+        return self.async_show_form(
+            step_id="user",
+            data_schema=vol.Schema({vol.Required("dtu_ip"): vol.In(choices)}),
+            errors=errors,
+        )
+
+    async def async_step_manual(self, user_input=None):
+        errors = {}
+
         if user_input is not None:
             if await self._test_connection(user_input["dtu_ip"], user_input["dtu_port"]):
                 return self.async_create_entry(title="Hoymiles Modbus TCP", data=user_input)
@@ -47,7 +95,7 @@ class HoymilesConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
                 errors["base"] = "cannot_connect"
 
         return self.async_show_form(
-            step_id="user",
+            step_id="manual",
             data_schema=DATA_SCHEMA,
             errors=errors,
         )
@@ -82,6 +130,14 @@ class HoymilesOptionsFlowHandler(config_entries.OptionsFlow):
         return vol.Schema({
             vol.Required("dtu_ip", default=defaults.get("dtu_ip", "")): str,
             vol.Required("dtu_port", default=defaults.get("dtu_port", "502")): str,
+            vol.Optional("max_ports", default=defaults.get("max_ports", DTU_MAX_PORTS)): vol.All(
+                vol.Coerce(int), vol.Range(min=1, max=DTU_MAX_PORTS)
+            ),
+            vol.Optional("import_statistics", default=defaults.get("import_statistics", False)): bool,
+            vol.Optional("telemetry_log", default=defaults.get("telemetry_log", False)): bool,
+            vol.Optional("telemetry_retention_days", default=defaults.get("telemetry_retention_days", 60)): vol.All(
+                vol.Coerce(int), vol.Range(min=1, max=3650)
+            ),
         })
 
     async def async_step_init(self, user_input=None):
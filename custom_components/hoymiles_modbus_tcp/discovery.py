@@ -0,0 +1,70 @@
+import asyncio
+import ipaddress
+import logging
+
+from .hoymiles_dtu_client import HoymilesDtuClient
+
+_LOGGER = logging.getLogger(__name__)
+
+# Keep probes short: a DTU on the LAN answers a TCP handshake in milliseconds
+PROBE_TIMEOUT = 0.5
+PROBE_CONCURRENCY = 64
+# Networks larger than this prefix are narrowed down to the /24 around the host
+MIN_SCAN_PREFIX = 24
+VERIFY_TIMEOUT = 3
+
+
+async def async_probe_port(host, port, timeout=PROBE_TIMEOUT):
+    """Return True if a TCP connection to host:port can be opened."""
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True
+
+
+async def async_verify_dtu(host, port, timeout=VERIFY_TIMEOUT):
+    """Read the DTU serial at 0x2000, returning it or None if host is not a DTU."""
+    client = HoymilesDtuClient(host=host, port=port)
+    client.connection_timeout = timeout
+    client.retries = 0
+    client.request_delay = 0
+    try:
+        serial = await asyncio.wait_for(client.read_serial_number(), timeout=timeout)
+    except Exception as e:
+        _LOGGER.debug(f"{host}:{port} accepted a connection but is not a DTU: {e}")
+        return None
+    finally:
+        await client.disconnect()
+    return serial or None
+
+
+def scan_network(address, prefix):
+    """Network to scan for an interface address, clamped to a /24 if it is larger."""
+    return ipaddress.ip_network(f"{address}/{max(prefix, MIN_SCAN_PREFIX)}", strict=False)
+
+
+async def async_discover_dtus(network, port=502, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """Scan every host of network for a DTU answering Modbus TCP on port.
+
+    Returns a dict mapping host address to DTU serial number.
+    """
+    network = ipaddress.ip_network(network, strict=False)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(host):
+        async with semaphore:
+            if not await async_probe_port(host, port, timeout):
+                return host, None
+            return host, await async_verify_dtu(host, port)
+
+    _LOGGER.debug(f"Scanning {network} for Hoymiles DTUs on port {port}")
+    results = await asyncio.gather(*(check(str(host)) for host in network.hosts()))
+    found = {host: serial for host, serial in results if serial}
+    _LOGGER.debug(f"Found {len(found)} DTUs in {network}: {found}")
+    return found
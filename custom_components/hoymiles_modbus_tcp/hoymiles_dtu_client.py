@@ -4,17 +4,42 @@ from pymodbus.client import AsyncModbusTcpClient
 from pymodbus.exceptions import ModbusException
 import time
 
+from .scheduler import FieldScheduler
+from .capture import CaptureWriter, STATUS_OK, STATUS_ERROR_RESPONSE, STATUS_EXCEPTION
+
 
 _LOGGER = logging.getLogger(__name__)
 
+# Every port occupies a block of 0x28 registers starting at 0x1000
+PORT_BASE_ADDRESS = 0x1000
+PORT_BLOCK_SIZE = 0x28
+# Port blocks end where the DTU data starts at 0x2000
+DTU_MAX_PORTS = (0x2000 - PORT_BASE_ADDRESS) // PORT_BLOCK_SIZE
+
+# A snapshot younger than this is served from memory instead of re-polling
+SNAPSHOT_MAX_AGE = 5
+# Largest share of the time polls may keep the DTU busy; slower polls stretch the interval
+POLL_DUTY_CYCLE = 0.5
+
+
+class DtuResponseError(ModbusException):
+    """The DTU answered the request with a Modbus exception response."""
+
 
 class HoymilesDtuClient:
-    def __init__(self, host, port):
+    def __init__(self, host, port, transport=None, capture_path=None, max_ports=None):
         self.host = host
         self.port = int(port)
-        self.client = None
+        # A transport (e.g. capture.ReplayTransport) replaces the Modbus TCP client
+        self.client = transport
+        # Time the scheduler plans with; a replay supplies the captured poll times
+        self.clock = getattr(transport, 'clock', time.time)
         self.base_address = 0x2000
         self.microinverters = []
+        # Indexes so lookups stay O(1) on large installations
+        self._microinverters_by_serial = {}
+        self._panels_by_address = {}
+        self.max_ports = min(int(max_ports), DTU_MAX_PORTS) if max_ports else DTU_MAX_PORTS
         # self.cache = {}
         
         # Connection settings
@@ -22,6 +47,31 @@ class HoymilesDtuClient:
         self.retry_on_empty = True
         self.retries = 3
         self.delay_on_connect = 0.5  # Small delay between requests
+        self.request_delay = 0.1  # Pause before every read to avoid overwhelming the DTU
+
+        # Latest decoded block of every port, keyed by port address
+        self.snapshot = {}
+        self.snapshot_time = None
+        # Time of the last poll that failed outright, so callers back off until max_age
+        self.poll_failed_time = None
+        self._snapshot_listeners = []
+        self._poll_lock = asyncio.Lock()
+
+        # Decides which fields are read on each poll tick
+        self.scheduler = FieldScheduler()
+
+        # Outcome of the last poll per port, keyed by port address
+        self.port_status = {}
+        self.poll_budget = 30  # Seconds a poll cycle may spend including retries
+        self.poll_retry_delay = 1
+
+        # Per-phase durations (seconds) of the last poll cycle
+        self.cycle_timings = {}
+        self.profiler = None
+
+        self.capture = None
+        if capture_path:
+            self.start_capture(capture_path)
 
     async def connect(self):
         """Establish connection to the DTU."""
@@ -50,6 +100,35 @@ class HoymilesDtuClient:
         if self.client and self.client.connected:
             self.client.close()
             _LOGGER.debug("Disconnected from DTU")
+        if self.capture:
+            await self.capture.async_flush()
+
+    def start_capture(self, path, **kwargs):
+        """Record every request/response pair to an append-only capture file."""
+        self.capture = CaptureWriter(path, **kwargs)
+        _LOGGER.debug(f"Capturing DTU registers to {path}")
+
+    async def stop_capture(self):
+        if self.capture:
+            await self.capture.async_flush()
+            self.capture = None
+
+    async def _read_holding_registers(self, address, count):
+        """Issue the Modbus read, recording it when capture mode is on."""
+        started = time.time()
+        t0 = time.perf_counter()
+        try:
+            result = await self.client.read_holding_registers(address, count=count)
+        except Exception:
+            if self.capture:
+                self.capture.append(started, time.perf_counter() - t0, address, count, STATUS_EXCEPTION)
+            raise
+        if self.capture:
+            if result.isError():
+                self.capture.append(started, time.perf_counter() - t0, address, count, STATUS_ERROR_RESPONSE)
+            else:
+                self.capture.append(started, time.perf_counter() - t0, address, count, STATUS_OK, result.registers)
+        return result
 
 
     def is_connected(self):
@@ -87,12 +166,12 @@ class HoymilesDtuClient:
 
         try:
             # Add small delay between requests to avoid overwhelming DTU
-            await asyncio.sleep(0.1)
+            await asyncio.sleep(self.request_delay)
             
-            result = await self.client.read_holding_registers(address, count=count)
+            result = await self._read_holding_registers(address, count)
             
             if result.isError():
-                raise ModbusException(f"Error reading address {hex(address)}: {result}")
+                raise DtuResponseError(f"Error reading address {hex(address)}: {result}")
             
             v = self.parse_response(result, data_type)
 
@@ -126,6 +205,10 @@ class HoymilesDtuClient:
             # self.cache_set(cache_key, v)
             # return v
             
+        except DtuResponseError as e:
+            # The DTU answered, so the connection itself is fine
+            _LOGGER.error(f"Failed to read address {hex(address)}: {e}")
+            raise
         except Exception as e:
             _LOGGER.error(f"Failed to read address {hex(address)}: {e}")
             # Try to reconnect on error
@@ -134,27 +217,197 @@ class HoymilesDtuClient:
 
     def parse_response(self, response, type):
         """Parse the response from the DTU based on the expected type."""
-        if type == 'uint16':
-            return response.registers[0]
-        elif type == 'int16':
-            return response.registers[0] if response.registers[0] < 0x8000 else response.registers[0] - 0x10000
-        elif type == 'uint32':
-            if len(response.registers) < 2:
-                raise ValueError("Not enough registers for uint32")
-            return (response.registers[0] << 16) | response.registers[1]
-        elif type == 'ascii':
-            v_bytes = b''.join(reg.to_bytes(2, 'big') for reg in response.registers)
-            return v_bytes.decode('ascii').strip('\x00')
-        elif type == 'ascii_bcd':
-            v_bytes = b''.join(reg.to_bytes(2, 'big') for reg in response.registers)
-            digits = ''.join(f"{(b >> 4) & 0xF}{b & 0xF}" for b in v_bytes)
-            return digits.strip('0')
-        elif type == 'hex':
-            v_bytes = b''.join(reg.to_bytes(2, 'big') for reg in response.registers)
-            return v_bytes.hex()
-        else:
-            raise ValueError(f"Unsupported data type: {type}")
-        
+        return parse_registers(response.registers, type)
+
+    async def read_registers(self, address, count):
+        """Read a raw range of holding registers."""
+        if not await self.connect():
+            raise Exception("Failed to connect to DTU")
+
+        try:
+            await asyncio.sleep(self.request_delay)
+
+            result = await self._read_holding_registers(address, count)
+
+            if result.isError():
+                raise DtuResponseError(f"Error reading address {hex(address)}: {result}")
+
+            return result.registers
+        except DtuResponseError:
+            raise
+        except Exception as e:
+            _LOGGER.warning(f"Failed to read registers {hex(address)} ({count}): {e}")
+            await self.disconnect()
+            raise
+
+    def add_snapshot_listener(self, listener):
+        """Register a callable invoked with the snapshot after every poll.
+
+        Returns a function that removes the listener again.
+        """
+        self._snapshot_listeners.append(listener)
+
+        def remove():
+            if listener in self._snapshot_listeners:
+                self._snapshot_listeners.remove(listener)
+
+        return remove
+
+    async def poll(self):
+        """Run one poll cycle, recording per-phase timings and profiling it when armed."""
+        timings = {'request': 0.0, 'decode': 0.0, 'publish': 0.0}
+        profiler = self.profiler
+        profiling = False
+        started = time.perf_counter()
+        try:
+            if profiler:
+                profiling = profiler.begin_cycle()
+            return await self._poll(timings)
+        finally:
+            timings['total'] = time.perf_counter() - started
+            self.cycle_timings = timings
+            if profiling:
+                profiler.end_cycle(timings)
+            if profiler and profiler.done and self.profiler is profiler:
+                self.profiler = None
+
+    async def _poll(self, timings):
+        """Read the fields that are due on this tick and decode them into the snapshot.
+
+        The scheduler picks the due fields and merges them into read ranges. A
+        failing range does not abort the cycle. Failed ranges are retried while
+        the poll budget allows; ports that still fail keep their previous values,
+        flagged as stale, so the rest of the station is published as usual.
+        """
+        deadline = time.time() + self.poll_budget
+        planned = self.clock()
+        ranges = self.scheduler.plan(self.get_panels(), planned)
+        pending = {read_range.start: read_range for read_range in ranges}
+        snapshot = {address: dict(values) for address, values in self.snapshot.items()}
+        refreshed = set()
+        errors = {}
+        attempt = 0
+
+        while pending:
+            attempt += 1
+            for start, read_range in list(pending.items()):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                t0 = time.perf_counter()
+                try:
+                    registers = await asyncio.wait_for(
+                        self.read_registers(start, read_range.count), timeout=remaining)
+                except asyncio.TimeoutError:
+                    await self.disconnect()
+                    errors[start] = "poll budget exhausted"
+                    continue
+                except Exception as e:
+                    errors[start] = str(e)
+                    continue
+                finally:
+                    timings['request'] += time.perf_counter() - t0
+
+                t0 = time.perf_counter()
+                try:
+                    decoded = [
+                        (panel, name, panel.decode_field(name, registers, start))
+                        for panel, name in read_range.fields
+                    ]
+                except Exception as e:
+                    errors[start] = str(e)
+                    continue
+                finally:
+                    timings['decode'] += time.perf_counter() - t0
+
+                for panel, name, value in decoded:
+                    snapshot.setdefault(panel.address, {})[name] = value
+                    refreshed.add(panel.address)
+                # Intervals count from the plan, so a replay plans the same reads
+                self.scheduler.mark_read(read_range, planned)
+                del pending[start]
+
+            if not pending or attempt > self.retries:
+                break
+            if time.time() + self.poll_retry_delay >= deadline:
+                break
+            _LOGGER.debug(f"Retrying {len(pending)} failed ranges (attempt {attempt + 1})")
+            await asyncio.sleep(self.poll_retry_delay)
+
+        failed_ports = {}
+        for start, read_range in pending.items():
+            for panel, _ in read_range.fields:
+                failed_ports[panel.address] = errors.get(start, "poll budget exhausted")
+        now = time.time()
+        self._update_port_status(refreshed, failed_ports, now)
+        for address in refreshed - failed_ports.keys():
+            snapshot[address]['updated'] = now
+            snapshot[address]['stale'] = False
+        for address in failed_ports:
+            if address in snapshot:
+                snapshot[address]['stale'] = True
+
+        self.snapshot = snapshot
+        if self.capture:
+            await self.capture.async_flush()
+        if pending and len(pending) == len(ranges):
+            raise Exception(f"Failed to read any of the {len(pending)} ranges from DTU")
+        if pending:
+            _LOGGER.warning(f"Publishing partial snapshot, {len(pending)} ranges failed: "
+                            f"{', '.join(hex(start) for start in pending)}")
+        self.snapshot_time = time.time()
+
+        t0 = time.perf_counter()
+        for listener in list(self._snapshot_listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                _LOGGER.error(f"Snapshot listener {listener} failed: {e}")
+        timings['publish'] = time.perf_counter() - t0
+        return snapshot
+
+    def _update_port_status(self, refreshed, failed_ports, now):
+        """Record per port whether this poll read it, forgetting ports no longer mapped."""
+        addresses = {panel.address for panel in self.get_panels()}
+        for address in list(self.port_status):
+            if address not in addresses:
+                del self.port_status[address]
+        for address in refreshed | failed_ports.keys():
+            status = self.port_status.setdefault(address, {
+                'ok': False, 'error': None, 'last_success': None, 'failures': 0,
+            })
+            if address in failed_ports:
+                status.update({'ok': False, 'error': failed_ports[address], 'failures': status['failures'] + 1})
+            else:
+                status.update({'ok': True, 'error': None, 'last_success': now, 'failures': 0})
+
+    def get_stale_ports(self):
+        """Return the addresses of ports whose values were not refreshed by the last poll."""
+        return [address for address, values in self.snapshot.items() if values.get('stale')]
+
+    async def get_snapshot(self, max_age=SNAPSHOT_MAX_AGE):
+        """Return the latest snapshot, polling the DTU if it is older than max_age seconds.
+
+        A poll that failed outright is not retried within max_age either, so the
+        sensors updating in the same tick do not each wait for the poll budget.
+        On large sites, where a cycle takes longer than the sensors' scan interval
+        allows (e.g. one request per port before a capability profile exists),
+        max_age is stretched to the cost of the last cycle over POLL_DUTY_CYCLE.
+        """
+        max_age = max(max_age, self.cycle_timings.get('total', 0) / POLL_DUTY_CYCLE)
+        async with self._poll_lock:
+            now = time.time()
+            if self.poll_failed_time is not None and now - self.poll_failed_time < max_age:
+                raise Exception(f"Last poll of the DTU failed {now - self.poll_failed_time:.0f}s ago, not retrying yet")
+            if self.snapshot_time is None or now - self.snapshot_time >= max_age:
+                try:
+                    await self.poll()
+                except Exception:
+                    self.poll_failed_time = time.time()
+                    raise
+                self.poll_failed_time = None
+        return self.snapshot
+
 
 
     async def test_connection(self):
@@ -191,15 +444,28 @@ class HoymilesDtuClient:
         return await self.read_address(self.get_address(0), 3,'ascii_bcd')
     
     async def map_microinverters(self):
-        for i in range(20):
-            base_address = 0x1000 + (i) * 40
+        """Discover the ports until the first empty one, up to max_ports.
 
-            sn = ''
-            try: 
-              sn = await self.read_address(base_address+1, 3, 'ascii_bcd')
-            except Exception as e:
+        The mapping is only done once per client, since every platform asks for it
+        during setup; reloading the integration maps the ports again. Mapping stops
+        at an empty serial or when the DTU refuses the read. Other errors are retried
+        and then raised, without keeping a partial mapping, so a network blip cannot
+        truncate the fleet.
+        """
+        if self._panels_by_address:
+            return len(self.microinverters)
+
+        for i in range(self.max_ports):
+            base_address = PORT_BASE_ADDRESS + (i) * PORT_BLOCK_SIZE
+
+            try:
+              sn = await self._read_port_serial(base_address)
+            except DtuResponseError:
               break
-            
+            except Exception as e:
+              self._clear_mapping()
+              raise Exception(f"Failed to map port {hex(base_address)}: {e}") from e
+
             if sn == '':
               break
 
@@ -210,21 +476,45 @@ class HoymilesDtuClient:
             else:
                 mi.add_panel(base_address)
                 continue
-        _LOGGER.debug(f"Found {len(self.microinverters)} microinverters")
+        _LOGGER.debug(f"Found {len(self.microinverters)} microinverters with {len(self._panels_by_address)} ports")
         return len(self.microinverters)
 
+    async def _read_port_serial(self, base_address):
+        attempt = 0
+        while True:
+            try:
+                return await self.read_address(base_address+1, 3, 'ascii_bcd')
+            except DtuResponseError:
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                _LOGGER.debug(f"Retrying serial number of port {hex(base_address)} (attempt {attempt + 1}): {e}")
+                await asyncio.sleep(self.poll_retry_delay)
+
+    def _clear_mapping(self):
+        self.microinverters = []
+        self._microinverters_by_serial = {}
+        self._panels_by_address = {}
+
     def add_microinverter(self, address, serial_number):
-       self.microinverters.append(Microinverter(self, address, serial_number))
+       mi = Microinverter(self, address, serial_number)
+       self.microinverters.append(mi)
+       self._microinverters_by_serial[serial_number] = mi
 
 
     def get_address(self,offset):
         return self.base_address + offset
     
     def get_microinverter(self, sn):
-        for mi in self.microinverters:
-            if mi.serial_number == sn:
-                return mi
-        return None
+        return self._microinverters_by_serial.get(sn)
+
+    def get_panels(self):
+        return list(self._panels_by_address.values())
+
+    def register_panel(self, panel):
+        self._panels_by_address[panel.address] = panel
     
 
     # def cache_set(self, key, value):
@@ -357,19 +647,37 @@ class HoymilesDtuClient:
           return True
       
     async def get_total_power(self):
-        total_power = 0
-        for mi in self.microinverters:
-            total_power += await mi.total_current_power()
-
-        return total_power
+        snapshot = await self.get_snapshot()
+        return sum(values.get('pv_power') or 0 for values in snapshot.values())
     
     async def get_daily_power(self):
-        total_power = 0
-        for mi in self.microinverters:
-            _LOGGER.debug(f"Getting daily production for microinverter {mi.serial_number}")
-            for panel in mi.panels:
-                total_power += await panel.get_today_production()
-        return total_power
+        snapshot = await self.get_snapshot()
+        return sum(values.get('today_production') or 0 for values in snapshot.values())
+
+
+def parse_registers(registers, type):
+    """Decode a list of raw registers based on the expected type."""
+    if type == 'uint16':
+        return registers[0]
+    elif type == 'int16':
+        return registers[0] if registers[0] < 0x8000 else registers[0] - 0x10000
+    elif type == 'uint32':
+        if len(registers) < 2:
+            raise ValueError("Not enough registers for uint32")
+        return (registers[0] << 16) | registers[1]
+    elif type == 'ascii':
+        v_bytes = b''.join(reg.to_bytes(2, 'big') for reg in registers)
+        return v_bytes.decode('ascii').strip('\x00')
+    elif type == 'ascii_bcd':
+        v_bytes = b''.join(reg.to_bytes(2, 'big') for reg in registers)
+        digits = ''.join(f"{(b >> 4) & 0xF}{b & 0xF}" for b in v_bytes)
+        return digits.strip('0')
+    elif type == 'hex':
+        v_bytes = b''.join(reg.to_bytes(2, 'big') for reg in registers)
+        return v_bytes.hex()
+    else:
+        raise ValueError(f"Unsupported data type: {type}")
+
 
 class Microinverter:
   def __init__(self, dtu, base_address, serial_number):
@@ -378,6 +686,7 @@ class Microinverter:
       self.addresses = [base_address]
       self.serial_number = serial_number
       self.panels = []
+      self._panels_by_address = {}
       self.add_panel(base_address)
 
       # self.panels.append(Panel(self.dtu.host, self.dtu.port, self.base_address, unit_id=2))
@@ -435,14 +744,14 @@ class Microinverter:
       }
 
   def add_panel(self, address): 
-    for existing_panel in self.panels:
-        if existing_panel.address == address:
-            _LOGGER.debug(f"Panel at address {hex(address)} already exists, skipping creation.")
-            return
-
+    if address in self._panels_by_address:
+        _LOGGER.debug(f"Panel at address {hex(address)} already exists, skipping creation.")
+        return
 
     panel = Panel(self, address)
     self.panels.append(panel)
+    self._panels_by_address[address] = panel
+    self.dtu.register_panel(panel)
 
   async def read_value(self, name, index=0):
       address, count, data_type = self.lookup[name]
@@ -488,6 +797,7 @@ class Panel:
       self.address = address
       self.lookup = {
           'serial_number':    (0x1001, 3, 'ascii_bcd'),
+          'port_number':      (0x1007, 1, 'uint16'),
           'pv_voltage':       (0x1008, 1, 'uint16'),   # V, often needs scaling (÷10)
           'pv_current':       (0x100A, 1, 'uint16'),   # A, often needs scaling (÷100)
           'grid_voltage':     (0x100C, 1, 'uint16'),   # V, often needs scaling (÷10)
@@ -501,7 +811,31 @@ class Panel:
           'alarm_count':      (0x101E, 1, 'uint16'),
           'link_status':      (0x1020, 1, 'uint16'),
       }
-      
+      # Divisors turning the raw register values into physical units
+      self.scales = {
+          'pv_voltage': 10,
+          'pv_current': 100,
+          'grid_voltage': 10,
+          'grid_frequency': 100,
+          'pv_power': 10,
+          'temperature': 10,
+      }
+
+  def field_address(self, name):
+      """Return the absolute register address and count of a lookup field."""
+      address, count, _ = self.lookup[name]
+      return (address - PORT_BASE_ADDRESS) + self.address, count
+
+  def decode_field(self, name, registers, start=None):
+      """Decode a field from registers read from start (the port address by default)."""
+      address, count, data_type = self.lookup[name]
+      start = self.address if start is None else start
+      offset = (address - PORT_BASE_ADDRESS) + self.address - start
+      value = parse_registers(registers[offset:offset + count], data_type)
+      if name in self.scales:
+          value = value / self.scales[name]
+      return value
+
   async def get_pv_voltage(self):
       return await self.read_value('pv_voltage') / 10
   async def get_pv_current(self):
@@ -0,0 +1,133 @@
+import logging
+from datetime import timedelta
+
+from homeassistant.components.recorder import get_instance
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import (
+    async_add_external_statistics,
+    get_last_statistics,
+)
+from homeassistant.const import UnitOfEnergy, UnitOfPower
+from homeassistant.util import dt as dt_util
+
+_LOGGER = logging.getLogger(__name__)
+DOMAIN = "hoymiles_modbus_tcp"
+
+HOUR = timedelta(hours=1)
+# Longest DTU downtime that is back-filled with flat energy statistics
+MAX_FILL_HOURS = 24 * 7
+
+
+class StatisticsImporter:
+    """Buffer per-port samples and bulk-import them as hourly long-term statistics.
+
+    Every poll snapshot is folded into per-port, per-hour accumulators instead of
+    being written as entity states. Once an hour is complete its power mean/min/max
+    and the lifetime energy counter are imported as external statistics in one call
+    per statistic. Hours without samples after DTU downtime are filled with the last
+    known energy, so the production of the gap shows up in the first hour after it.
+    """
+
+    def __init__(self, hass, sid, name):
+        self.hass = hass
+        self.sid = sid
+        self.name = name
+        # address -> {hour start: [samples, power total, power min, power max, energy kWh]}
+        self._hours = {}
+        self._labels = {}
+        # statistic_id -> (start, state, sum) of the last imported energy hour
+        self._last_energy = {}
+
+    def process(self, snapshot):
+        hour = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)
+        for address, values in snapshot.items():
+            power = values.get('pv_power')
+            if values.get('stale') or power is None:
+                continue
+            self._labels.setdefault(address, f"{values.get('serial_number')} port {values.get('port_number')}")
+            bucket = self._hours.setdefault(address, {}).setdefault(hour, [0, 0.0, power, power, None])
+            bucket[0] += 1
+            bucket[1] += power
+            bucket[2] = min(bucket[2], power)
+            bucket[3] = max(bucket[3], power)
+            if values.get('total_production') is not None:
+                bucket[4] = values['total_production'] / 1000
+
+    def statistic_id(self, address, kind):
+        return f"{DOMAIN}:{self.sid}_{address:04x}_{kind}"
+
+    async def async_import(self, now=None):
+        """Import every completed hour that is still buffered."""
+        current_hour = dt_util.utcnow().replace(minute=0, second=0, microsecond=0)
+        # process() may add ports while an import awaits the recorder
+        for address, hours in list(self._hours.items()):
+            completed = sorted(hour for hour in hours if hour < current_hour)
+            if not completed:
+                continue
+            buckets = [(hour, hours.pop(hour)) for hour in completed]
+            try:
+                self._import_power(address, buckets)
+                await self._async_import_energy(address, buckets)
+            except Exception as e:
+                _LOGGER.error(f"Failed to import statistics for port {hex(address)}: {e}")
+
+    def _import_power(self, address, buckets):
+        metadata = StatisticMetaData(
+            has_mean=True,
+            has_sum=False,
+            name=f"{self.name} {self._labels[address]} Power",
+            source=DOMAIN,
+            statistic_id=self.statistic_id(address, "power"),
+            unit_of_measurement=UnitOfPower.WATT,
+        )
+        statistics = [
+            StatisticData(start=hour, mean=total / count, min=low, max=high)
+            for hour, (count, total, low, high, _) in buckets
+        ]
+        async_add_external_statistics(self.hass, metadata, statistics)
+
+    async def _async_import_energy(self, address, buckets):
+        statistic_id = self.statistic_id(address, "energy")
+        if statistic_id not in self._last_energy:
+            self._last_energy[statistic_id] = await self._async_last_energy(statistic_id)
+
+        energy_by_hour = {hour: bucket[4] for hour, bucket in buckets if bucket[4] is not None}
+        last = self._last_energy[statistic_id]
+        if last is None:
+            if not energy_by_hour:
+                return
+            hour = min(energy_by_hour)
+            state = energy_by_hour[hour]
+        else:
+            hour = max(last[0] + HOUR, buckets[0][0] - MAX_FILL_HOURS * HOUR)
+            state = last[1]
+
+        statistics = []
+        while hour <= buckets[-1][0]:
+            state = energy_by_hour.get(hour, state)
+            # The lifetime counter doubles as the cumulative sum
+            statistics.append(StatisticData(start=hour, state=state, sum=state))
+            hour += HOUR
+        if not statistics:
+            return
+
+        metadata = StatisticMetaData(
+            has_mean=False,
+            has_sum=True,
+            name=f"{self.name} {self._labels[address]} Energy",
+            source=DOMAIN,
+            statistic_id=statistic_id,
+            unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+        )
+        async_add_external_statistics(self.hass, metadata, statistics)
+        self._last_energy[statistic_id] = (statistics[-1]["start"], state, state)
+
+    async def _async_last_energy(self, statistic_id):
+        result = await get_instance(self.hass).async_add_executor_job(
+            get_last_statistics, self.hass, 1, statistic_id, True, {"state", "sum"}
+        )
+        rows = result.get(statistic_id)
+        if not rows:
+            return None
+        row = rows[0]
+        return dt_util.utc_from_timestamp(row["start"]), row["state"], row["sum"]
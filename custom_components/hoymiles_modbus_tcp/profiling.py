@@ -0,0 +1,119 @@
+import asyncio
+import cProfile
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+_LOGGER = logging.getLogger(__name__)
+
+# Frames kept per allocation traceback and allocation sites in the summary
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+
+# cProfile hooks the whole interpreter, so only one cycle is profiled at a time
+_active_cycle = None
+
+
+class PollProfiler:
+    """Profile the next poll cycles of a HoymilesDtuClient.
+
+    Arm it by assigning it to client.profiler. Every cycle runs under cProfile
+    (which sees everything the event loop does while the cycle is in flight) and
+    tracemalloc. Only one cycle is profiled at a time across all clients; a cycle
+    starting while another one is profiled runs unprofiled and is not counted.
+    Tracing is only active during a profiled cycle, so a profiler that is
+    replaced or dropped before it finishes leaves nothing running. Once the
+    requested number of cycles has run, a .prof file and a text summary with the
+    top allocations and the per-phase timings are written next to each other in
+    output_dir.
+    """
+
+    def __init__(self, output_dir, name, cycles=5):
+        self.cycles = cycles
+        self.done = False
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.prof_path = os.path.join(output_dir, f"{name}_{stamp}.prof")
+        self.summary_path = os.path.join(output_dir, f"{name}_{stamp}_allocations.txt")
+
+        self._profile = cProfile.Profile()
+        self._timings = []
+        # Allocation site -> [size, count] of what each cycle left allocated
+        self._allocations = {}
+        self._tracing = False
+
+    def begin_cycle(self):
+        """Start profiling a cycle, returning False if this cycle is not profiled."""
+        global _active_cycle
+        if self.done or _active_cycle is not None:
+            return False
+        try:
+            if sys.getprofile() is not None:
+                # Older Pythons would silently take over the other profiler's hook
+                raise ValueError("a profile hook is already installed")
+            self._profile.enable()
+        except ValueError as e:
+            # Python 3.12+ refuses a second profiler, e.g. HA's own profiler integration
+            _LOGGER.warning(f"Cannot profile poll cycles, another profiler is active: {e}")
+            self.done = True
+            return False
+        _active_cycle = self
+        # Tracing someone else started is used but left running
+        self._tracing = not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        return True
+
+    def end_cycle(self, timings):
+        global _active_cycle
+        self._profile.disable()
+        _active_cycle = None
+        snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        if snapshot is not None:
+            for stat in snapshot.statistics("lineno"):
+                totals = self._allocations.setdefault(str(stat.traceback), [0, 0])
+                totals[0] += stat.size
+                totals[1] += stat.count
+
+        self._timings.append(dict(timings))
+        if len(self._timings) < self.cycles:
+            return
+
+        self.done = True
+        future = asyncio.get_running_loop().run_in_executor(None, self._write)
+        future.add_done_callback(self._written)
+
+    def close(self):
+        """Stop profiling further cycles, e.g. when the profiler is replaced or unloaded."""
+        if not self.done:
+            _LOGGER.info(f"Poll profile {self.prof_path} cancelled after {len(self._timings)} cycles")
+        self.done = True
+
+    def _written(self, future):
+        if future.exception() is not None:
+            _LOGGER.error(f"Could not write poll profile to {self.prof_path}: {future.exception()}")
+
+    def _write(self):
+        self._profile.dump_stats(self.prof_path)
+
+        lines = [f"Poll cycles profiled: {len(self._timings)}", ""]
+        lines.append("cycle   request(ms)  decode(ms)  publish(ms)  total(ms)")
+        for i, timings in enumerate(self._timings, 1):
+            lines.append(
+                f"{i:5d}  {timings['request'] * 1000:12.1f}{timings['decode'] * 1000:12.1f}"
+                f"{timings['publish'] * 1000:13.1f}{timings['total'] * 1000:11.1f}"
+            )
+        lines.append("")
+        if self._allocations:
+            lines.append(f"Top {TOP_ALLOCATIONS} allocation sites (left allocated per cycle, summed):")
+            top = sorted(self._allocations.items(), key=lambda item: item[1][0], reverse=True)
+            for site, (size, count) in top[:TOP_ALLOCATIONS]:
+                lines.append(f"{site}: size={size / 1024:.1f} KiB, count={count}")
+
+        with open(self.summary_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        _LOGGER.info(f"Wrote poll profile to {self.prof_path} and {self.summary_path}")
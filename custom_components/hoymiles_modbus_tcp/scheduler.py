@@ -0,0 +1,102 @@
+import logging
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# Refresh classes: seconds between reads, None means read once
+FAST = 0
+MEDIUM = 300
+SLOW = 3600
+STATIC = None
+
+FIELD_CLASSES = {
+    'pv_power':         FAST,
+    'operating_status': FAST,
+    'alarm_code':       FAST,
+    'alarm_count':      FAST,
+    'link_status':      FAST,
+    'pv_voltage':       MEDIUM,
+    'pv_current':       MEDIUM,
+    'grid_voltage':     MEDIUM,
+    'grid_frequency':   MEDIUM,
+    'temperature':      MEDIUM,
+    'today_production': MEDIUM,
+    'total_production': SLOW,
+    'serial_number':    STATIC,
+    'port_number':      STATIC,
+}
+
+# A single port block is known to be readable in one request on every DTU
+DEFAULT_MAX_COUNT = 0x28
+# Reading a few unused registers is cheaper than another round-trip
+DEFAULT_MAX_GAP = 0x28
+
+
+class ReadRange:
+    """A contiguous register range and the port fields decoded from it."""
+
+    def __init__(self, start, count, fields):
+        self.start = start
+        self.count = count
+        self.fields = fields  # list of (panel, field name)
+
+    def __repr__(self):
+        return f"ReadRange({hex(self.start)}, {self.count}, {len(self.fields)} fields)"
+
+
+class FieldScheduler:
+    """Decide which port fields are due on a tick and merge them into read ranges.
+
+    Every field of Panel.lookup belongs to a refresh class. A tick only plans the
+    fields whose interval has elapsed (or that were never read successfully),
+    sorted by address and merged into as few ranges as max_count and max_gap allow.
+    """
+
+    def __init__(self, field_classes=None, max_count=DEFAULT_MAX_COUNT, max_gap=DEFAULT_MAX_GAP):
+        self.field_classes = dict(FIELD_CLASSES if field_classes is None else field_classes)
+        self.max_count = max_count
+        self.max_gap = max_gap
+        # Fields the DTU refuses to read, as found by the capability probe
+        self.disabled_fields = set()
+        self._last_read = {}
+
+    def is_due(self, address, name, now):
+        last = self._last_read.get((address, name))
+        if last is None:
+            return True
+        interval = self.field_classes.get(name, FAST)
+        if interval is STATIC:
+            return False
+        return now - last >= interval
+
+    def plan(self, panels, now=None):
+        """Build the list of ReadRanges covering every field that is due."""
+        now = time.time() if now is None else now
+        spans = []
+        for panel in panels:
+            for name in panel.lookup:
+                if name in self.disabled_fields:
+                    continue
+                if self.is_due(panel.address, name, now):
+                    address, count = panel.field_address(name)
+                    spans.append((address, count, panel, name))
+        spans.sort(key=lambda span: span[0])
+
+        ranges = []
+        current = None
+        for address, count, panel, name in spans:
+            end = address + count
+            if current is not None:
+                current_end = current.start + current.count
+                if address - current_end <= self.max_gap and max(end, current_end) - current.start <= self.max_count:
+                    current.count = max(end, current_end) - current.start
+                    current.fields.append((panel, name))
+                    continue
+            current = ReadRange(address, count, [(panel, name)])
+            ranges.append(current)
+        return ranges
+
+    def mark_read(self, read_range, now=None):
+        now = time.time() if now is None else now
+        for panel, name in read_range.fields:
+            self._last_read[(panel.address, name)] = now
@@ -1,18 +1,25 @@
 # custom_components/hoymiles_modbus_tcp/sensor.py
 
 import logging
+from datetime import timedelta
 from homeassistant.components.sensor import SensorEntity
+from homeassistant.const import EntityCategory
 from homeassistant.const import UnitOfPower, UnitOfEnergy  # Updated imports for units
 import time
 
 
 # from .hoymiles_dtu_client import HoymilesClient
 from .ha_hoymiles_dtu import HAHoymilesDTU
+from .analytics import PanelPerformanceAnalyzer
+from .scheduler import MEDIUM
 
 
 _LOGGER = logging.getLogger(__name__)
 DOMAIN = "hoymiles_modbus_tcp"
 
+# Polls only read the fast lane fields, slower fields ride along when due
+SCAN_INTERVAL = timedelta(seconds=10)
+
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
     dtu = HAHoymilesDTU(hass, DOMAIN, hass.data[DOMAIN][config_entry.entry_id])
@@ -26,12 +33,43 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     name = dtu.name
     _LOGGER.debug(f"Setting up Hoymiles DTU with SID {sid} and name {name}")
 
+    client = hass.data[DOMAIN][config_entry.entry_id]
+    analyzer = PanelPerformanceAnalyzer()
+    config_entry.async_on_unload(client.add_snapshot_listener(analyzer.process))
+
     entities = [
         HoymilesStationPowerSensor(hass.data[DOMAIN][config_entry.entry_id], name, sid, device_info),
-        HoymilesStationDailyEnergySensor(hass.data[DOMAIN][config_entry.entry_id], name, sid, device_info)
+        HoymilesStationDailyEnergySensor(hass.data[DOMAIN][config_entry.entry_id], name, sid, device_info),
+        HoymilesUnderperformingPanelsSensor(analyzer, name, sid, device_info),
+        HoymilesPollCycleSensor(client, name, sid, device_info),
     ]
+    for panel in client.get_panels():
+        entities.append(HoymilesPanelRelativeYieldSensor(analyzer, panel, name, sid, device_info))
     async_add_entities(entities)
 
+    if config_entry.data.get("import_statistics"):
+        # Imported lazily so the recorder is only needed when the mode is enabled
+        from homeassistant.helpers.event import async_track_time_change
+        from .long_term_statistics import StatisticsImporter
+
+        importer = StatisticsImporter(hass, sid, name)
+        # Hourly energy statistics need the lifetime counter more often than hourly
+        client.scheduler.field_classes['total_production'] = MEDIUM
+        config_entry.async_on_unload(client.add_snapshot_listener(importer.process))
+        config_entry.async_on_unload(
+            async_track_time_change(hass, importer.async_import, minute=5, second=0)
+        )
+
+    if config_entry.data.get("telemetry_log"):
+        from .telemetry_log import DEFAULT_RETENTION_DAYS, TelemetryLogger
+
+        telemetry = TelemetryLogger(
+            hass.config.path(f"{DOMAIN}_telemetry", dtu.serial),
+            retention_days=config_entry.data.get("telemetry_retention_days", DEFAULT_RETENTION_DAYS),
+            get_ports=lambda: [panel.address for panel in client.get_panels()],
+        )
+        config_entry.async_on_unload(client.add_snapshot_listener(telemetry.process))
+
 
 
 class HoymilesStationPowerSensor(SensorEntity):
@@ -53,12 +91,15 @@ class HoymilesStationPowerSensor(SensorEntity):
     @property
     def native_value(self):
         return self._state
-    
-    @property
-    def scan_interval(self):
-        """Return the scan interval in seconds."""
-        return 120
 
+    @property
+    def extra_state_attributes(self):
+        snapshot = self._client.snapshot
+        return {
+            "ports": len(snapshot),
+            "stale_ports": [hex(address) for address in self._client.get_stale_ports()],
+            "last_updated": {hex(address): values.get('updated') for address, values in snapshot.items()},
+        }
 
     async def async_update(self):
         _LOGGER.debug(f"Fetching current power for station {self._sid}")
@@ -86,11 +127,6 @@ class HoymilesStationDailyEnergySensor(SensorEntity):
     def native_value(self):
         return self._state
 
-    @property
-    def scan_interval(self):
-        """Return the scan interval in seconds."""
-        return 120
-
     async def async_update(self):
         #only update the daily energy once every 2 minutes
         if self._state is not None and (time.time() - self._last_update < 120):
@@ -103,4 +139,93 @@ class HoymilesStationDailyEnergySensor(SensorEntity):
         daily_energy = await self._client.get_daily_power()
         _LOGGER.debug(f"Received daily energy data for station {self._sid}: {daily_energy} kWh")
         self._state = float(daily_energy)/1000
-        # Convert to kWh
\ No newline at end of file
+        # Convert to kWh
+
+
+class HoymilesUnderperformingPanelsSensor(SensorEntity):
+    """Number of panels the analyzer flags as persistently underperforming."""
+    def __init__(self, analyzer, name, sid, device_info):
+        self._analyzer = analyzer
+        self._sid = sid
+        self._attr_name = f"{name} Underperforming Panels"
+        self._attr_unique_id = f"{sid}_underperforming_panels"
+        self._attr_state_class = "measurement"
+        self._attr_icon = "mdi:solar-panel"
+        self._attr_should_poll = False
+        self._attr_device_info = device_info
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._analyzer.add_listener(self.async_write_ha_state))
+
+    @property
+    def native_value(self):
+        return len(self._analyzer.outliers)
+
+    @property
+    def extra_state_attributes(self):
+        return {
+            "panels": [hex(address) for address in self._analyzer.outliers],
+            "scores": {hex(address): self._analyzer.results[address]['score'] for address in self._analyzer.outliers},
+        }
+
+
+class HoymilesPanelRelativeYieldSensor(SensorEntity):
+    """Rolling yield of a single port relative to the fleet median, in %."""
+    def __init__(self, analyzer, panel, name, sid, device_info):
+        self._analyzer = analyzer
+        self._address = panel.address
+        self._attr_name = f"{name} Panel {panel.microinverter.serial_number} {hex(panel.address)} Relative Yield"
+        self._attr_unique_id = f"{sid}_{hex(panel.address)}_relative_yield"
+        self._attr_native_unit_of_measurement = "%"
+        self._attr_state_class = "measurement"
+        self._attr_icon = "mdi:solar-panel"
+        self._attr_should_poll = False
+        self._attr_device_info = device_info
+
+    async def async_added_to_hass(self):
+        self.async_on_remove(self._analyzer.add_listener(self.async_write_ha_state))
+
+    @property
+    def native_value(self):
+        result = self._analyzer.results.get(self._address)
+        if result is None or result['relative_yield'] is None:
+            return None
+        return round(result['relative_yield'] * 100, 1)
+
+    @property
+    def extra_state_attributes(self):
+        result = self._analyzer.results.get(self._address, {})
+        return {
+            "score": result.get('score'),
+            "sibling_ratio": result.get('sibling_ratio'),
+            "underperforming": self._address in self._analyzer.outliers,
+        }
+
+
+class HoymilesPollCycleSensor(SensorEntity):
+    """Duration of the last poll cycle, split into request, decode and publish phases."""
+    def __init__(self, client, name, sid, device_info):
+        self._client = client
+        self._sid = sid
+        self._attr_name = f"{name} Poll Cycle Duration"
+        self._attr_unique_id = f"{sid}_poll_cycle_duration"
+        self._attr_native_unit_of_measurement = "ms"
+        self._attr_state_class = "measurement"
+        self._attr_entity_category = EntityCategory.DIAGNOSTIC
+        self._attr_icon = "mdi:timer-outline"
+        # Polling only reads the timings the client kept, it never talks to the DTU
+        self._attr_should_poll = True
+        self._attr_device_info = device_info
+
+    @property
+    def native_value(self):
+        total = self._client.cycle_timings.get('total')
+        return None if total is None else round(total * 1000, 1)
+
+    @property
+    def extra_state_attributes(self):
+        return {
+            f"{phase}_ms": round(duration * 1000, 1)
+            for phase, duration in self._client.cycle_timings.items()
+            if phase != 'total'
+        }
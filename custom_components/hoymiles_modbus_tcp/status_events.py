@@ -0,0 +1,123 @@
+import logging
+from homeassistant.core import callback
+
+_LOGGER = logging.getLogger(__name__)
+DOMAIN = "hoymiles_modbus_tcp"
+
+EVENT_NAME = f"{DOMAIN}_event"
+
+# Status fields decoded from the port blocks that drive the events
+STATUS_FIELDS = ('operating_status', 'alarm_code', 'alarm_count', 'link_status')
+
+
+class StatusEventEngine:
+    """Turn status fields of the poll snapshot into edge-triggered events.
+
+    The previous status of every port is kept so that HA events are only fired
+    on transitions (alarm raised/cleared, alarm count increased, link lost/restored)
+    and listeners are only notified when the problem state actually changes.
+    """
+
+    def __init__(self, hass, sid):
+        self.hass = hass
+        self.sid = sid
+        self._previous = {}
+        self._listeners = []
+
+        # Current problem state, keyed by port address
+        self.active_alarms = {}
+        self.lost_links = {}
+
+    def add_listener(self, listener):
+        """Register a callable invoked when the problem state changes."""
+        self._listeners.append(listener)
+
+        def remove():
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove
+
+    @callback
+    def process(self, snapshot):
+        """Compare a new snapshot against the previous one and fire events on changes."""
+        changed = False
+        for address, values in snapshot.items():
+            status = {name: values.get(name) for name in STATUS_FIELDS}
+            # operating_status is informative only, so a DTU refusing it still gets events
+            if any(status[name] is None for name in ('alarm_code', 'alarm_count', 'link_status')):
+                continue
+
+            previous = self._previous.get(address)
+            self._previous[address] = status
+
+            if previous is None:
+                # First sighting of this port: seed the state without firing events
+                changed |= self._set_alarm(address, values, status['alarm_code'])
+                changed |= self._set_link(address, values, status['link_status'])
+                continue
+
+            if status['alarm_code'] != previous['alarm_code']:
+                if status['alarm_code']:
+                    self._fire('alarm_raised', address, values)
+                elif previous['alarm_code']:
+                    self._fire('alarm_cleared', address, values)
+                changed |= self._set_alarm(address, values, status['alarm_code'])
+
+            if status['alarm_count'] > previous['alarm_count']:
+                self._fire('alarm_count_increased', address, values,
+                           previous_alarm_count=previous['alarm_count'])
+
+            was_linked = is_linked(previous['link_status'])
+            now_linked = is_linked(status['link_status'])
+            if was_linked and not now_linked:
+                self._fire('link_lost', address, values)
+            elif now_linked and not was_linked:
+                self._fire('link_restored', address, values)
+            if was_linked != now_linked:
+                changed |= self._set_link(address, values, status['link_status'])
+
+        if changed:
+            for listener in list(self._listeners):
+                listener()
+
+    def _set_alarm(self, address, values, alarm_code):
+        key = port_key(address, values)
+        if alarm_code:
+            if self.active_alarms.get(key) == alarm_code:
+                return False
+            self.active_alarms[key] = alarm_code
+            return True
+        return self.active_alarms.pop(key, None) is not None
+
+    def _set_link(self, address, values, link_status):
+        key = port_key(address, values)
+        if not is_linked(link_status):
+            if key in self.lost_links:
+                return False
+            self.lost_links[key] = link_status
+            return True
+        return self.lost_links.pop(key, None) is not None
+
+    def _fire(self, event_type, address, values, **extra):
+        data = {
+            "type": event_type,
+            "dtu": self.sid,
+            "port_address": hex(address),
+            "serial_number": values.get('serial_number'),
+            "port_number": values.get('port_number'),
+        }
+        data.update({name: values.get(name) for name in STATUS_FIELDS})
+        data.update(extra)
+        _LOGGER.debug(f"Firing {EVENT_NAME} {event_type} for port {hex(address)}: {data}")
+        self.hass.bus.async_fire(EVENT_NAME, data)
+
+
+def is_linked(link_status):
+    """The DTU reports a non-zero link status while the microinverter is reachable."""
+    return bool(link_status)
+
+
+def port_key(address, values):
+    """Human readable identifier of a port, used in attributes."""
+    return f"{values.get('serial_number')}/{values.get('port_number')} ({hex(address)})"
@@ -0,0 +1,217 @@
+"""Append-only on-disk log of per-port telemetry, readable as NumPy arrays.
+
+Every day gets a pair of files in the log directory:
+
+    telemetry-YYYYMMDD.bin   fixed-width records, appended per poll that changed a value
+    telemetry-YYYYMMDD.json  the index: port addresses, record dtype and scales
+
+A record holds the poll timestamp and, per field, the raw integer value of every
+port (missing or stale values are stored as the field's MISSING sentinel). Only
+per-port fields are kept; inverter-wide values (grid voltage and frequency) and
+today's production, which follows from the total, are left out. A poll whose
+values all equal the previous record, e.g. at night, is not logged. Every
+mapped port is logged from the first record on, whether it answered yet or not.
+When the port layout changes, e.g. after a reload mapped other ports, the part
+of the day logged with the old layout is kept as telemetry-YYYYMMDD-HHMMSS and a
+new file starts, so a day's file maps straight into a structured array without
+parsing:
+
+    day = load_day("/config/hoymiles_telemetry", "20250601")
+    day.records["pv_power"]      # (n_records, n_ports) raw values
+    day.scaled("pv_power")       # same in W, with NaN where missing
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+
+import numpy as np
+
+_LOGGER = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_RETENTION_DAYS = 60
+
+# Field, storage type and the factor turning physical units into the stored integers
+FIELDS = (
+    ('pv_voltage',       '<u2', 10),
+    ('pv_current',       '<u2', 100),
+    ('pv_power',         '<u2', 10),
+    ('temperature',      '<i2', 10),
+    ('total_production', '<u4', 1),
+)
+
+MISSING = {
+    '<u2': np.iinfo(np.uint16).max,
+    '<i2': np.iinfo(np.int16).min,
+    '<u4': np.iinfo(np.uint32).max,
+}
+
+
+def record_dtype(port_count, fields=FIELDS):
+    return np.dtype([('timestamp', '<u4')] + [(name, fmt, (port_count,)) for name, fmt, _ in fields])
+
+
+def day_paths(directory, day):
+    base = os.path.join(directory, f"telemetry-{day}")
+    return f"{base}.bin", f"{base}.json"
+
+
+class TelemetryDay:
+    """A day of telemetry memory-mapped as a structured array."""
+
+    def __init__(self, records, index):
+        self.records = records
+        self.index = index
+        self.ports = index['ports']
+        self.timestamps = records['timestamp']
+
+    def scaled(self, name):
+        """Return a field in physical units as float, NaN where it was missing."""
+        fmt, scale = self.index['fields'][name]
+        raw = self.records[name]
+        values = raw.astype(np.float64) / scale
+        values[raw == MISSING[fmt]] = np.nan
+        return values
+
+
+def load_day(directory, day):
+    """Map the log of day (YYYYMMDD) into a TelemetryDay without reading it."""
+    data_path, index_path = day_paths(directory, day)
+    with open(index_path) as f:
+        index = json.load(f)
+    fields = [(name, fmt, scale) for name, (fmt, scale) in index['fields'].items()]
+    dtype = record_dtype(len(index['ports']), fields)
+    if os.path.getsize(data_path) < dtype.itemsize:
+        return TelemetryDay(np.zeros(0, dtype=dtype), index)
+    # A partially written trailing record is ignored
+    count = os.path.getsize(data_path) // dtype.itemsize
+    return TelemetryDay(np.memmap(data_path, dtype=dtype, mode='r', shape=(count,)), index)
+
+
+class TelemetryLogger:
+    """Append a fixed-width record per poll snapshot to the day's log file.
+
+    process() packs the record on the event loop and hands the blocking write to
+    an executor. The pending list is only touched on the loop and one write runs
+    at a time, so records always land in order and under their layout. get_ports returns the addresses of all mapped ports, so a port
+    missing from the snapshot still gets a column. Files older than retention_days
+    are removed when a new day starts.
+    """
+
+    def __init__(self, directory, retention_days=DEFAULT_RETENTION_DAYS, get_ports=None):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.get_ports = get_ports
+        self._day = None
+        self._ports = None
+        self._dtype = None
+        # Field values of the last logged record, to skip polls that changed nothing
+        self._previous = None
+        self._pending = []
+        self._writing = None
+
+    def process(self, snapshot):
+        now = datetime.datetime.now()
+        day = now.strftime("%Y%m%d")
+        ports = set(snapshot)
+        if self.get_ports is not None:
+            ports.update(self.get_ports())
+        ports = sorted(ports)
+        if day != self._day or ports != self._ports:
+            self._day = day
+            self._ports = ports
+            self._dtype = record_dtype(len(ports))
+            self._previous = None
+            self._pending.append((day, ports, None))
+
+        record = np.zeros(1, dtype=self._dtype)
+        record['timestamp'] = int(now.timestamp())
+        for name, fmt, scale in FIELDS:
+            values = np.array([
+                np.nan if address not in snapshot or snapshot[address].get('stale')
+                else _float(snapshot[address].get(name))
+                for address in self._ports
+            ])
+            missing = np.isnan(values)
+            low, high = _storable_range(fmt)
+            raw = np.clip(np.round(np.where(missing, 0, values) * scale), low, high)
+            record[name] = np.where(missing, MISSING[fmt], raw).astype(fmt)
+        data = record.tobytes()
+        # The timestamp leads the record
+        values = data[np.dtype('<u4').itemsize:]
+        if values == self._previous:
+            return
+        self._previous = values
+        self._pending.append((day, None, data))
+        self._schedule_write()
+
+    def _schedule_write(self):
+        if self._writing is not None or not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        self._writing = asyncio.get_running_loop().run_in_executor(None, self._write, pending)
+        self._writing.add_done_callback(self._written)
+
+    def _written(self, future):
+        self._writing = None
+        if future.exception() is not None:
+            _LOGGER.error(f"Could not write telemetry to {self.directory}: {future.exception()}")
+        # Records queued while the write was running
+        self._schedule_write()
+
+    def _write(self, pending):
+        for day, ports, data in pending:
+            if data is None:
+                self._start_layout(day, ports)
+                continue
+            data_path, _ = day_paths(self.directory, day)
+            with open(data_path, 'ab') as f:
+                f.write(data)
+
+    def _start_layout(self, day, ports):
+        """Start the day's file for a port layout, unless the file already uses it."""
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, index_path = day_paths(self.directory, day)
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                existing = json.load(f)
+            if existing['ports'] == ports:
+                return
+            # Keep what was logged with the old layout next to the new file
+            archived = f"{day}-{datetime.datetime.now().strftime('%H%M%S')}"
+            archived_data, archived_index = day_paths(self.directory, archived)
+            if os.path.exists(data_path):
+                os.replace(data_path, archived_data)
+            os.replace(index_path, archived_index)
+            _LOGGER.warning(f"Port layout changed, earlier telemetry of today moved to {archived_data}")
+        index = {
+            'version': INDEX_VERSION,
+            'day': day,
+            'ports': ports,
+            'record_size': record_dtype(len(ports)).itemsize,
+            'fields': {name: (fmt, scale) for name, fmt, scale in FIELDS},
+        }
+        with open(index_path, 'w') as f:
+            json.dump(index, f)
+        self._remove_expired(day)
+
+    def _remove_expired(self, day):
+        cutoff = (datetime.datetime.strptime(day, "%Y%m%d")
+                  - datetime.timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        for filename in os.listdir(self.directory):
+            if filename.startswith("telemetry-") and filename[10:18] < cutoff:
+                os.remove(os.path.join(self.directory, filename))
+
+
+def _storable_range(fmt):
+    """Range of values that can be stored without colliding with the MISSING sentinel."""
+    info = np.iinfo(fmt)
+    if MISSING[fmt] == info.min:
+        return info.min + 1, info.max
+    return info.min, info.max - 1
+
+
+def _float(value):
+    return np.nan if value is None else float(value)